@@ -0,0 +1,185 @@
+"""
+module to store a disparity sequence in a single npy file.
+
+- All frames are written into one memory mapped npy file of shape (max_frames, H, W).
+- The number of valid frames is saved in a sidecar json file.
+  It is rewritten every INDEX_INTERVAL frames during capture, and marked as closed at the end.
+- Directories with per-frame npy files (zed_disparity_00000.npy, ...) can be read as well.
+- Disparity is saved as uint16 fixed point value in 1/DISPARITY_SCALE pixel. 0 means invalid.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from dataclasses_json import dataclass_json
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+ARCHIVE_NAME = "zed_disparity.npy"
+INDEX_NAME = "zed_disparity.json"
+INDEX_INTERVAL = 30  # [frame]
+DISPARITY_SCALE = 16  # same as the fixed point disparity of cv2.StereoSGBM
+
+
+def quantize_disparity(disparity: np.ndarray) -> np.ndarray:
+    """
+    convert disparity [pixel] to uint16 fixed point value.
+    NaN, PosInf, NegInf and negative disparity are saved as 0 (invalid).
+    """
+    raw = np.multiply(disparity, DISPARITY_SCALE, dtype=np.float32)
+    np.nan_to_num(raw, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    np.rint(raw, out=raw)
+    np.clip(raw, 0, np.iinfo(np.uint16).max, out=raw)
+    return raw.astype(np.uint16)
+
+
+def dequantize_disparity(raw: np.ndarray) -> np.ndarray:
+    """
+    convert uint16 fixed point value to disparity [pixel]. invalid value is converted to NaN.
+    float disparity (e.g. per-frame npy files by older version) is returned as is.
+    """
+    if raw.dtype != np.uint16:
+        return raw
+    disparity = raw.astype(np.float32)
+    disparity /= DISPARITY_SCALE
+    disparity[raw == 0] = np.nan
+    return disparity
+
+
+_FRAME_NUMBER_RE = re.compile(r"(.*)_(\d+)")
+
+
+def frame_name(disparity_dir: Path, counter: int) -> Path:
+    return disparity_dir / f"zed_disparity_{counter:05d}.npy"
+
+
+def _frame_key(stem: str) -> Tuple[str, int]:
+    """left_00012 -> ("left", 12)"""
+    m = _FRAME_NUMBER_RE.fullmatch(stem)
+    if m is None:
+        return stem, -1
+    return m.group(1), int(m.group(2))
+
+
+def list_frame_files(directory: Path, suffix: str) -> List[Path]:
+    """
+    files with suffix directly under directory, sorted by the frame number (e.g. left_00012.png).
+    os.scandir() does not walk subdirectories and does not stat each entry.
+    """
+    with os.scandir(directory) as it:
+        names = [entry.name for entry in it if entry.name.endswith(suffix) and entry.is_file()]
+    return [directory / name for name in sorted(names, key=lambda name: _frame_key(name[: -len(suffix)]))]
+
+
+@dataclass_json
+@dataclass
+class ArchiveIndex:
+    """
+    index = ArchiveIndex(num_frames=num_frames, closed=True)
+    index.save_json(disparity_dir / INDEX_NAME)
+    index = ArchiveIndex.load_json(disparity_dir / INDEX_NAME)
+
+    closed=False means the capture was still running (or was killed):
+    at least num_frames frames are written.
+    """
+
+    num_frames: int = 0
+    closed: bool = True
+
+    def save_json(self, name: Path):
+        open(name, "wt").write(self.to_json())
+
+    @classmethod
+    def load_json(cls, name: Path):
+        return cls.from_json(open(name, "rt").read())
+
+
+class DisparityArchiveWriter:
+    """
+    writer = DisparityArchiveWriter(disparity_dir, max_frames=1000)
+    while not writer.is_full():
+        writer.write(disparity)
+    writer.close()
+    """
+
+    def __init__(self, disparity_dir: Path, max_frames: int, index_interval: int = INDEX_INTERVAL):
+        self.disparity_dir = disparity_dir
+        self.max_frames = max_frames
+        self.index_interval = index_interval
+        self.num_frames = 0
+        self.memmap: Optional[np.memmap] = None
+
+    def write(self, disparity: np.ndarray):
+        if self.memmap is None:
+            # allocated at the first frame, when the shape and dtype are known.
+            self.memmap = np.lib.format.open_memmap(
+                str(self.disparity_dir / ARCHIVE_NAME),
+                mode="w+",
+                dtype=disparity.dtype,
+                shape=(self.max_frames,) + disparity.shape,
+            )
+            # replace the index of a previous capture into the same directory.
+            self._save_index(closed=False)
+        self.memmap[self.num_frames] = disparity
+        self.num_frames += 1
+        if self.num_frames % self.index_interval == 0:
+            self._save_index(closed=False)
+
+    def _save_index(self, closed: bool):
+        ArchiveIndex(num_frames=self.num_frames, closed=closed).save_json(self.disparity_dir / INDEX_NAME)
+
+    def is_full(self) -> bool:
+        return self.num_frames >= self.max_frames
+
+    def close(self):
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+        self._save_index(closed=True)
+
+
+def _num_frames(disparity_dir: Path, archive: np.ndarray) -> int:
+    """
+    number of captured frames in the archive.
+    if the capture was killed before close(), the frames after the last saved index are used
+    up to the first empty slot. at most INDEX_INTERVAL slots are scanned.
+    """
+    index_name = disparity_dir / INDEX_NAME
+    index = ArchiveIndex.load_json(index_name) if index_name.is_file() else ArchiveIndex(closed=False)
+    if index.closed:
+        return index.num_frames
+    num_frames = index.num_frames
+    while num_frames < len(archive) and archive[num_frames].any():
+        num_frames += 1
+    return num_frames
+
+
+class DisparityFrames:
+    """
+    sequence of disparity frames in disparity_dir.
+    frames are read from the memory mapped archive if it exists, otherwise from per-frame npy files.
+
+    frames = DisparityFrames(disparity_dir)
+    for name, disparity in zip(frames.names, frames):
+        ...
+    """
+
+    def __init__(self, disparity_dir: Path):
+        archive_name = disparity_dir / ARCHIVE_NAME
+        self.archive: Optional[np.ndarray] = None
+        if archive_name.is_file():
+            archive = np.load(str(archive_name), mmap_mode="r")
+            self.archive = archive[: _num_frames(disparity_dir, archive)]
+            self.names: List[Path] = [frame_name(disparity_dir, i) for i in range(len(self.archive))]
+        else:
+            self.names = list_frame_files(disparity_dir, ".npy")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if self.archive is not None:
+            return np.array(self.archive[i])  # read the frame here, not at the first access to the array.
+        return np.load(str(self.names[i]))
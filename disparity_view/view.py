@@ -3,9 +3,12 @@ library to view disparity npy files.
 """
 
 import argparse
+import functools
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -13,39 +16,136 @@ import open3d as o3d
 from tqdm import tqdm
 
 
+from disparity_view.disparity_archive import (
+    ARCHIVE_NAME,
+    DISPARITY_SCALE,
+    DisparityFrames,
+    dequantize_disparity,
+    list_frame_files,
+)
 from disparity_view.zed_info import CameraParameter
 
+LEFT_VIDEO_NAME = "left.mp4"
+RIGHT_VIDEO_NAME = "right.mp4"
+
 
 def finitemax(depth: np.ndarray) -> float:
-    return np.nanmax(depth[np.isfinite(depth)])
+    return finite_minmax(depth)[1]
 
 
 def finitemin(depth: np.ndarray) -> float:
-    return np.nanmin(depth[np.isfinite(depth)])
+    return finite_minmax(depth)[0]
+
+
+def finite_minmax(depth: np.ndarray) -> Tuple[float, float]:
+    """
+    min and max of finite values (NaN, PosInf, NegInf are ignored).
+    The finite mask is built only once for both reductions.
+    """
+    if not np.issubdtype(depth.dtype, np.floating):
+        return depth.min(), depth.max()  # integer arrays have no NaN, PosInf, NegInf.
+    finite = depth[np.isfinite(depth)]
+    return finite.min(), finite.max()
+
+
+@functools.lru_cache(maxsize=8)
+def _uint16_lut(vmin: float, vmax: float) -> np.ndarray:
+    """
+    uint8 value for every uint16 value, same as normalize_image() of float input.
+    all values are mapped to 0 for an empty range (e.g. automatic range of a frame without valid disparity).
+    """
+    if vmax <= vmin:
+        return np.zeros(65536, dtype=np.uint8)
+    lut = np.arange(65536, dtype=np.float32)
+    lut -= vmin
+    lut *= 255.0 / (vmax - vmin)
+    np.rint(lut, out=lut)
+    np.clip(lut, 0, 255, out=lut)
+    return lut.astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=8)
+def _uint16_color_lut(vmin: float, vmax: float, colormap: int) -> np.ndarray:
+    """
+    BGR color for every uint16 value: _uint16_lut() and cv2.applyColorMap() composed into a 65536 x 3 table.
+    """
+    return cv2.applyColorMap(_uint16_lut(vmin, vmax).reshape(-1, 1), colormap).reshape(-1, 3)
+
+
+_TAKE_ROWS = 64
+
+
+def _take(lut: np.ndarray, indices: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    if dst is None or dst.shape != indices.shape + lut.shape[1:] or dst.dtype != lut.dtype:
+        return lut[indices]
+    # mode="clip" writes directly into dst. uint16 indices never exceed the 65536 entries of lut.
+    # row blocks keep the intp copy of indices made by np.take small.
+    for i in range(0, indices.shape[0], _TAKE_ROWS):
+        np.take(lut, indices[i : i + _TAKE_ROWS], axis=0, out=dst[i : i + _TAKE_ROWS], mode="clip")
+    return dst
 
 
-def normalize_image(depth_raw: np.ndarray, vmax=None, vmin=None) -> np.ndarray:
+def _value_range(depth_raw: np.ndarray, vmin=None, vmax=None) -> Tuple[float, float]:
+    if vmin is None and vmax is None:
+        return finite_minmax(depth_raw)
     vmin = finitemin(depth_raw) if vmin is None else vmin
     vmax = finitemax(depth_raw) if vmax is None else vmax
-    depth_raw = (depth_raw - vmin) / (vmax - vmin) * 255.0
-    depth_raw = depth_raw.astype(np.uint8)  # depth_raw might have NaN, PosInf, NegInf.
-    return depth_raw
+    return vmin, vmax
 
 
-def as_colorimage(depth_raw: np.ndarray, vmin=None, vmax=None, colormap=cv2.COLORMAP_INFERNO) -> np.ndarray:
+def normalize_image(depth_raw: np.ndarray, vmax=None, vmin=None, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    scale depth_raw from [vmin, vmax] to uint8 [0, 255].
+    dst: uint8 output buffer to be reused for every frame.
+    """
+    vmin, vmax = _value_range(depth_raw, vmin, vmax)
+    if depth_raw.dtype == np.uint16:
+        # a table lookup instead of the arithmetic for each pixel. the table is reused while vmin, vmax are same.
+        return _take(_uint16_lut(float(vmin), float(vmax)), depth_raw, dst)
+    # all values are mapped to 0 for an empty range, same as _uint16_lut().
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    # scale, shift and saturate_cast to uint8 in a single pass of OpenCV. NaN becomes 0.
+    # cv2.convertScaleAbs() is not used, because it folds values below vmin by abs().
+    return cv2.addWeighted(depth_raw, scale, depth_raw, 0.0, -vmin * scale, dst=dst, dtype=cv2.CV_8U)
+
+
+def as_colorimage(
+    depth_raw: np.ndarray, vmin=None, vmax=None, colormap=cv2.COLORMAP_INFERNO, dst: Optional[np.ndarray] = None
+) -> np.ndarray:
     """
     apply color mapping with vmin, vmax
+    dst: BGR output buffer to be reused for every frame.
     """
+    if depth_raw.dtype == np.uint16:
+        # normalization and color mapping are a single table lookup.
+        vmin, vmax = _value_range(depth_raw, vmin, vmax)
+        return _take(_uint16_color_lut(float(vmin), float(vmax), colormap), depth_raw, dst)
     depth_raw = normalize_image(depth_raw, vmax, vmin)
-    return cv2.applyColorMap(depth_raw, colormap)
+    return cv2.applyColorMap(depth_raw, colormap, dst=dst)
 
 
-def as_gray(depth_raw: np.ndarray, vmin=None, vmax=None) -> np.ndarray:
+def as_gray(depth_raw: np.ndarray, vmin=None, vmax=None, dst: Optional[np.ndarray] = None) -> np.ndarray:
     """
     apply color mapping with vmin, vmax
+    dst: BGR output buffer to be reused for every frame.
     """
     gray = normalize_image(depth_raw, vmax, vmin)
-    return cv2.merge((gray, gray, gray))
+    # single contiguous write. a read-only np.broadcast_to view is not accepted everywhere by cv2.
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=dst)
+
+
+def concat_images(left: np.ndarray, right: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    same as np.concatenate((left, right), axis=1).
+    dst: output buffer to be reused for every frame. a new buffer is allocated if the shape or dtype differs.
+    """
+    H, W = left.shape[:2]
+    shape = (H, W + right.shape[1]) + left.shape[2:]
+    if dst is None or dst.shape != shape or dst.dtype != left.dtype:
+        dst = np.empty(shape, dtype=left.dtype)
+    dst[:, :W] = left
+    dst[:, W:] = right
+    return dst
 
 
 def resize_image(image: np.ndarray, rate: float) -> np.ndarray:
@@ -67,6 +167,65 @@ def get_dirs(captured_dir: Path) -> Tuple[Path, Path, Path]:
     return leftdir, rightdir, disparity_dir
 
 
+def prefetch(load: Callable, items: Iterable, depth: int = 4, max_workers: int = 2) -> Iterator:
+    """
+    yield load(item) in order of items.
+    up to depth items are loaded ahead in background threads,
+    so that file reading and decoding overlap with the processing of the current item.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = deque()
+        for item in items:
+            futures.append(executor.submit(load, item))
+            if len(futures) >= depth:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def _video_frames(cap: cv2.VideoCapture, num_frames: int) -> Iterator[np.ndarray]:
+    """
+    yield prefetched frames of cap, until the first failed read (e.g. a video not closed by the writer).
+    cap is released at the end.
+    """
+    # a single worker keeps the order of sequential reads.
+    reads = prefetch(lambda _: cap.read(), range(num_frames), max_workers=1)
+    try:
+        for ok, image in reads:
+            if not ok:
+                break
+            yield image
+    finally:
+        reads.close()  # wait for the pending reads before release.
+        cap.release()
+
+
+def left_image_frames(leftdir: Path) -> Tuple[List[Path], Iterator[np.ndarray]]:
+    """
+    names and prefetched images of the left camera.
+    images are read from leftdir/left.mp4 if it exists, otherwise from png files.
+    """
+    video_name = leftdir / LEFT_VIDEO_NAME
+    if video_name.is_file():
+        cap = cv2.VideoCapture(str(video_name))
+        num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        names = [leftdir / f"left_{i:05d}.png" for i in range(num_frames)]
+        return names, _video_frames(cap, num_frames)
+    names = list_frame_files(leftdir, ".png")
+    return names, prefetch(lambda name: cv2.imread(str(name)), names)
+
+
+def _frames(leftdir: Path, disparity_dir: Path) -> Tuple[int, Iterator[Tuple[Path, Path, np.ndarray, np.ndarray]]]:
+    """
+    number of frames and iterator of (leftname, disparity_name, image, disparity)
+    """
+    left_names, left_images = left_image_frames(leftdir)
+    disparity_frames = DisparityFrames(disparity_dir)
+    num_frames = min(len(left_names), len(disparity_frames))
+    disparities = prefetch(disparity_frames.__getitem__, range(num_frames))
+    return num_frames, zip(left_names, disparity_frames.names, left_images, disparities)
+
+
 def view_by_colormap(args):
     captured_dir = Path(args.captured_dir)
     leftdir, rightdir, disparity_dir = get_dirs(captured_dir)
@@ -74,31 +233,31 @@ def view_by_colormap(args):
     vmax = args.vmax
     vmin = args.vmin
 
-    left_images = sorted(leftdir.glob("**/*.png"))
-    disparity_npys = sorted(disparity_dir.glob("**/*.npy"))
+    num_frames, frames = _frames(leftdir, disparity_dir)
     cv2.namedWindow("left depth", cv2.WINDOW_NORMAL)
-    for leftname, disparity_name in tqdm(list(zip(left_images, disparity_npys))):
+    colored = None  # reused for every frame
+    results = None  # reused for every frame
+    for leftname, disparity_name, image, disparity in tqdm(frames, total=num_frames):
         print(leftname, disparity_name)
-        image = cv2.imread(str(leftname))
-        disparity = np.load(str(disparity_name))
         colored_name = disparity_name.with_suffix(".png")
+        if disparity.dtype == np.uint16:  # fixed point disparity
+            vmin, vmax = args.vmin * DISPARITY_SCALE, args.vmax * DISPARITY_SCALE
 
         if args.gray:
-            colored = as_gray(disparity)
+            colored = as_gray(disparity, dst=colored)
         elif args.jet:
-            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_JET)
+            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_JET, dst=colored)
         elif args.inferno:
-            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_INFERNO)
+            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_INFERNO, dst=colored)
         else:
-            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_JET)
+            colored = as_colorimage(disparity, vmax=vmax, vmin=vmin, colormap=cv2.COLORMAP_JET, dst=colored)
 
         assert image.shape == colored.shape
         assert image.dtype == colored.dtype
         if args.save:
             cv2.imwrite(str(colored_name), colored)
-        results = np.concatenate((image, colored), axis=1)
-        results = resize_image(results, rate=0.5)
-        cv2.imshow("left depth", results)
+        results = concat_images(image, colored, dst=results)
+        cv2.imshow("left depth", resize_image(results, rate=0.5))
         cv2.waitKey(10)
         time.sleep(sec)
 
@@ -108,9 +267,6 @@ def view3d(args):
     leftdir, _, disparity_dir = get_dirs(captured_dir)
     sec = args.sec
 
-    left_images = sorted(leftdir.glob("**/*.png"))
-    disparity_npys = sorted(disparity_dir.glob("**/*.npy"))
-
     json_file = captured_dir / "camera_param.json"
     camera_parameter = CameraParameter.load_json(json_file)
 
@@ -122,26 +278,41 @@ def view3d(args):
     cy = camera_parameter.cy
 
     left_cam_intrinsic = o3d.camera.PinholeCameraIntrinsic(width=width, height=height, fx=fx, fy=fy, cx=cx, cy=cy)
+    # point cloud is created by the tensor api of open3d, on GPU if available.
+    device = o3d.core.Device("CUDA:0") if o3d.core.cuda.is_available() else o3d.core.Device("CPU:0")
+    intrinsic_tensor = o3d.core.Tensor(left_cam_intrinsic.intrinsic_matrix, dtype=o3d.core.Dtype.Float64)
+    extrinsic_tensor = o3d.core.Tensor(np.eye(4), dtype=o3d.core.Dtype.Float64)
 
     vis = o3d.visualization.Visualizer()
     vis.create_window()
-    for leftname, disparity_name in tqdm(list(zip(left_images, disparity_npys))):
+    # a single geometry is updated for every frame, instead of adding a new geometry to the visualizer.
+    pcd = o3d.geometry.PointCloud()
+    geometry_added = False
+    baseline = camera_parameter.baseline
+    focal_length = camera_parameter.fx
+    num_frames, frames = _frames(leftdir, disparity_dir)
+    for leftname, disparity_name, image, disparity in tqdm(frames, total=num_frames):
         print(leftname, disparity_name)
         plyname = disparity_name.with_suffix(".ply")
-        disparity = np.load(str(disparity_name))
-        baseline = camera_parameter.baseline
-        focal_length = camera_parameter.fx
-        depth = baseline * focal_length / disparity
-
-        rgb = o3d.io.read_image(str(leftname))
-        open3d_depth = o3d.geometry.Image(depth)
-        rgbd_image = o3d.geometry.RGBDImage.create_from_color_and_depth(rgb, open3d_depth)
-
-        pcd = o3d.geometry.PointCloud.create_from_rgbd_image(rgbd_image, left_cam_intrinsic)
+        depth = (baseline * focal_length / dequantize_disparity(disparity)).astype(np.float32)
+
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        color_tensor = o3d.t.geometry.Image(o3d.core.Tensor(rgb, device=device))
+        depth_tensor = o3d.t.geometry.Image(o3d.core.Tensor(depth, device=device))
+        rgbd_image = o3d.t.geometry.RGBDImage(color_tensor, depth_tensor)
+        # depth_scale, depth_max are same as the defaults of the legacy create_from_color_and_depth()
+        pcd_tensor = o3d.t.geometry.PointCloud.create_from_rgbd_image(
+            rgbd_image, intrinsic_tensor, extrinsic_tensor, depth_scale=1000.0, depth_max=3.0
+        )
+        frame_pcd = pcd_tensor.to_legacy()  # legacy Visualizer accepts only legacy geometry.
         if args.save:
-            o3d.io.write_point_cloud(str(plyname), pcd)
-        pcd.transform([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
-        vis.add_geometry(pcd)
+            o3d.io.write_point_cloud(str(plyname), frame_pcd)
+        frame_pcd.transform([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
+        pcd.points = frame_pcd.points
+        pcd.colors = frame_pcd.colors
+        if not geometry_added:
+            vis.add_geometry(pcd)  # the view point is set by the first frame.
+            geometry_added = True
         vis.update_geometry(pcd)
         vis.poll_events()
         vis.update_renderer()
@@ -208,13 +379,17 @@ def view_npy_main():
 
     args = parser.parse_args()
     print(args)
-    if Path(args.npy_file).is_file():
+    if Path(args.npy_file).is_file() and Path(args.npy_file).name == ARCHIVE_NAME:
+        # only the captured frames of the archive, not all the slots of max_frames.
+        disparity_frames = DisparityFrames(Path(args.npy_file).parent)
+        for disparity in tqdm(disparity_frames):
+            view_npy(disparity, args)
+    elif Path(args.npy_file).is_file():
         disparity = np.load(args.npy_file)
         view_npy(disparity, args)
     elif Path(args.npy_file).is_dir():
-        npys = sorted(Path(args.npy_file).glob("*.npy"))
-        for npy in tqdm(npys):
-            disparity = np.load(npy)
+        disparity_frames = DisparityFrames(Path(args.npy_file))
+        for disparity in tqdm(disparity_frames):
             view_npy(disparity, args)
     else:
         print(f"no such file {args.npy_file}")
@@ -11,15 +11,25 @@ requirement:
 import pyzed.sl as sl
 
 import argparse
+import queue
+import re
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Tuple
 
 import cv2
 import numpy as np
 
-from disparity_view.view import as_colorimage, get_dirs, resize_image
+from disparity_view.disparity_archive import DisparityArchiveWriter, quantize_disparity
+from disparity_view.view import LEFT_VIDEO_NAME, RIGHT_VIDEO_NAME, as_colorimage, concat_images, get_dirs, resize_image
 from disparity_view.zed_info import CameraParameter
 
+_NUMERICAL_IP_RE = re.compile(r"(\d{1,3}\.){3}\d{1,3}")
+_IP_PORT_RE = re.compile(r"(\d{1,3}\.){3}\d{1,3}:\d{1,5}")
+
 
 def parse_args_to_params(args, init_params):
     if len(args.input_svo_file) > 0 and args.input_svo_file.endswith(".svo"):
@@ -28,7 +38,8 @@ def parse_args_to_params(args, init_params):
     elif len(args.ip_address) > 0:
         ip_str = args.ip_address
         if _is_ip_address(ip_str):
-            init_params.set_from_stream(ip_str.split(":")[0], int(ip_str.split(":")[1]))
+            ip, port = ip_str.split(":")
+            init_params.set_from_stream(ip, int(port))
             print("[Sample] Using Stream input, IP : ", ip_str)
         elif _is_numerical_ip_address(ip_str):
             init_params.set_from_stream(ip_str)
@@ -60,15 +71,68 @@ def parse_args_to_params(args, init_params):
 
 
 def _is_numerical_ip_address(ip_str: str) -> bool:
-    return ip_str.replace(":", "").replace(".", "").isdigit() and len(ip_str.split(".")) == 4
+    """a.b.c.d"""
+    return _NUMERICAL_IP_RE.fullmatch(ip_str) is not None
 
 
 def _is_ip_address(ip_str: str) -> bool:
-    return (
-        ip_str.replace(":", "").replace(".", "").isdigit()
-        and len(ip_str.split(".")) == 4
-        and len(ip_str.split(":")) == 2
-    )
+    """a.b.c.d:port"""
+    return _IP_PORT_RE.fullmatch(ip_str) is not None
+
+
+class StereoImageWriter:
+    """
+    save left and right images as png files, or as mp4 video files in video mode.
+    encoding and file writing run in background threads, so that the next zed.grab() is not blocked.
+
+    writer = StereoImageWriter(leftdir, rightdir, video=True, fps=30, size=(width, height))
+    writer.write(counter, cv_left_image, cv_right_image)
+    writer.close()
+    """
+
+    def __init__(
+        self, leftdir: Path, rightdir: Path, video: bool, fps: float, size: Tuple[int, int], max_pending: int = 8
+    ):
+        self.leftdir = leftdir
+        self.rightdir = rightdir
+        self.video_writers = None
+        if video:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self.video_writers = (
+                cv2.VideoWriter(str(leftdir / LEFT_VIDEO_NAME), fourcc, fps, size),
+                cv2.VideoWriter(str(rightdir / RIGHT_VIDEO_NAME), fourcc, fps, size),
+            )
+        # video frames must be written in order, png files can be written in parallel.
+        self.executor = ThreadPoolExecutor(max_workers=1 if video else 4)
+        self.max_pending = max_pending
+        self.pending = deque()
+
+    def _submit(self, func, *args):
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()  # wait for the oldest write, when writing is slower than capture.
+        self.pending.append(self.executor.submit(func, *args))
+
+    def write(self, counter: int, cv_left_image: np.ndarray, cv_right_image: np.ndarray):
+        """
+        the images are written later in a background thread. do not modify them after this call.
+        """
+        if self.video_writers is not None:
+            self._submit(self.video_writers[0].write, cv_left_image)
+            self._submit(self.video_writers[1].write, cv_right_image)
+            return
+        leftname = self.leftdir / f"left_{counter:05d}.png"
+        rightname = self.rightdir / f"right_{counter:05d}.png"
+        self._submit(cv2.imwrite, str(leftname), cv_left_image)
+        self._submit(cv2.imwrite, str(rightname), cv_right_image)
+        print(f"saving {leftname} {rightname}")
+
+    def close(self):
+        while self.pending:
+            self.pending.popleft().result()
+        self.executor.shutdown()
+        if self.video_writers is not None:
+            for video_writer in self.video_writers:
+                video_writer.release()
 
 
 def capture_main(args):
@@ -86,10 +150,6 @@ def capture_main(args):
         print(err)
         sys.exit(1)
 
-    left_image = sl.Mat()
-    right_image = sl.Mat()
-    depth = sl.Mat()
-    depth_image = sl.Mat()
     runtime_parameters = sl.RuntimeParameters()
     runtime_parameters.measure3D_reference_frame = sl.REFERENCE_FRAME.WORLD
     runtime_parameters.confidence_threshold = args.confidence_threshold
@@ -103,51 +163,93 @@ def capture_main(args):
     json_name = outdir / "camera_param.json"
     camera_parameter.save_json(json_name)
 
-    counter = 0
-    while True:
+    size = (camera_parameter.width, camera_parameter.height)
+    image_writer = StereoImageWriter(leftdir, rightdir, args.video, cam_info.camera_configuration.fps, size)
+    disparity_writer = DisparityArchiveWriter(disparity_dir, max_frames=args.max_frames)
+    try:
+        _capture_loop(zed, runtime_parameters, camera_parameter, image_writer, disparity_writer, title)
+    finally:
+        image_writer.close()
+        disparity_writer.close()
+        print(f"saved {disparity_writer.num_frames} frames of disparity in {disparity_dir}")
+        zed.close()
+
+
+def _grab_frames(zed, runtime_parameters, frames: queue.Queue, stop: threading.Event):
+    """
+    producer thread: grab and retrieve from the camera, and put (left, right, depth) into frames.
+    the arrays are owned by the consumer, so the SDK buffers can be reused for the next grab.
+    """
+    left_image = sl.Mat()
+    right_image = sl.Mat()
+    depth = sl.Mat()
+    while not stop.is_set():
         if zed.grab(runtime_parameters) != sl.ERROR_CODE.SUCCESS:
             continue
 
         zed.retrieve_image(left_image, sl.VIEW.LEFT, sl.MEM.CPU)
         zed.retrieve_image(right_image, sl.VIEW.RIGHT, sl.MEM.CPU)
-        zed.retrieve_image(depth_image, sl.VIEW.DEPTH)
         zed.retrieve_measure(depth, sl.MEASURE.DEPTH)
-        cv_left_image = left_image.get_data()
-        assert cv_left_image.shape[2] == 4  # ZED SDK dependent.
-        cv_left_image = cv_left_image[:, :, :3].copy()
-        cv_left_image = np.ascontiguousarray(cv_left_image)
-        cv_right_image = right_image.get_data()
-        assert cv_right_image.shape[2] == 4  # ZED SDK dependent.
-        cv_right_image = cv_right_image[:, :, :3].copy()
-        cv_right_image = np.ascontiguousarray(cv_right_image)
-        cv_depth_img = depth_image.get_data()[:, :, 0]
-        depth_data = depth.get_data()
-        leftname = leftdir / f"left_{counter:05d}.png"
-        rightname = rightdir / f"right_{counter:05d}.png"
-        cv2.imwrite(str(leftname), cv_left_image)
-        cv2.imwrite(str(rightname), cv_right_image)
-        print(f"saved {leftname} {rightname}")
+        left_bgra = left_image.get_data()
+        assert left_bgra.shape[2] == 4  # ZED SDK dependent.
+        cv_left_image = cv2.cvtColor(left_bgra, cv2.COLOR_BGRA2BGR)
+        right_bgra = right_image.get_data()
+        assert right_bgra.shape[2] == 4  # ZED SDK dependent.
+        cv_right_image = cv2.cvtColor(right_bgra, cv2.COLOR_BGRA2BGR)
+        depth_data = np.array(depth.get_data())
+        while not stop.is_set():
+            try:
+                frames.put((cv_left_image, cv_right_image, depth_data), timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+
+def _capture_loop(zed, runtime_parameters, camera_parameter, image_writer, disparity_writer, title):
+    """
+    consumer: save and show frames from the producer thread.
+    """
+    frames = queue.Queue(maxsize=4)
+    stop = threading.Event()
+    producer = threading.Thread(target=_grab_frames, args=(zed, runtime_parameters, frames, stop), daemon=True)
+    producer.start()
+    try:
+        _consume_frames(frames, producer, camera_parameter, image_writer, disparity_writer, title)
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _consume_frames(frames, producer, camera_parameter, image_writer, disparity_writer, title):
+    colored_depth_image = None
+    results = None
+    baseline = camera_parameter.baseline
+    focal_length = camera_parameter.fx
+
+    print(f"press 'q' to stop. capture stops after {disparity_writer.max_frames} frames (--max_frames).")
+    counter = 0
+    while not disparity_writer.is_full():
+        try:
+            cv_left_image, cv_right_image, depth_data = frames.get(timeout=0.1)
+        except queue.Empty:
+            if not producer.is_alive():
+                break  # the producer stopped by an error.
+            continue
+        image_writer.write(counter, cv_left_image, cv_right_image)
 
         assert cv_left_image.shape[2] == 3
         assert cv_left_image.dtype == np.uint8
-        zed.retrieve_measure(depth, sl.MEASURE.DEPTH)
-        zed_depth = depth.get_data()
-        baseline = camera_parameter.baseline
-        focal_length = camera_parameter.fx
-        disparity = baseline * focal_length / zed_depth
-        disparity_npyname = disparity_dir / f"zed_disparity_{counter:05d}.npy"
-        np.save(disparity_npyname, disparity)
-        colored_depth_image = as_colorimage(zed_depth)
-        results = np.concatenate((cv_left_image, colored_depth_image), axis=1)
-        results = resize_image(results, rate=0.5)
-        cv2.imshow(title, results)
+        disparity = baseline * focal_length / depth_data
+        disparity_writer.write(quantize_disparity(disparity))
+        colored_depth_image = as_colorimage(depth_data, dst=colored_depth_image)
+        results = concat_images(cv_left_image, colored_depth_image, dst=results)
+        cv2.imshow(title, resize_image(results, rate=0.5))
         key = cv2.waitKey(1)
         counter += 1
         if key == ord("q"):
-            sys.exit()
-
-    if "zed" in locals():
-        zed.close()
+            break
+    else:
+        print(f"disparity archive is full (max_frames={disparity_writer.max_frames}), stopping capture")
 
 
 def main():
@@ -181,6 +283,17 @@ def main():
         help="image pair output",
         default="outdir",
     )
+    parser.add_argument(
+        "--max_frames",
+        type=int,
+        help="max number of frames to capture (size of the disparity archive). capture stops when reached",
+        default=1000,
+    )
+    parser.add_argument(
+        "--video",
+        action="store_true",
+        help="save left and right images as mp4 video instead of png files",
+    )
 
     args = parser.parse_args()
     if len(args.input_svo_file) > 0 and len(args.ip_address) > 0:
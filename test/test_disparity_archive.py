@@ -0,0 +1,100 @@
+import numpy as np
+
+from disparity_view.disparity_archive import (
+    ARCHIVE_NAME,
+    INDEX_NAME,
+    ArchiveIndex,
+    DisparityArchiveWriter,
+    DisparityFrames,
+    dequantize_disparity,
+    frame_name,
+    list_frame_files,
+    quantize_disparity,
+)
+
+
+def test_archive_write_read(tmp_path):
+    writer = DisparityArchiveWriter(tmp_path, max_frames=5)
+    disparities = [np.full((4, 6), i, dtype=np.float32) for i in range(3)]
+    for disparity in disparities:
+        writer.write(disparity)
+    assert not writer.is_full()
+    writer.close()
+
+    frames = DisparityFrames(tmp_path)
+    assert len(frames) == 3
+    assert frames.names[0] == frame_name(tmp_path, 0)
+    for expected, disparity in zip(disparities, frames):
+        assert disparity.dtype == np.float32
+        assert np.array_equal(expected, disparity)
+
+
+def test_per_frame_npy(tmp_path):
+    for i in range(2):
+        np.save(frame_name(tmp_path, i), np.full((4, 6), i, dtype=np.float32))
+    frames = DisparityFrames(tmp_path)
+    assert len(frames) == 2
+    assert frames[1][0, 0] == 1
+
+
+def test_quantize_disparity():
+    disparity = np.array([[0.5, 100.25], [np.nan, np.inf]], dtype=np.float32)
+    raw = quantize_disparity(disparity)
+    assert raw.dtype == np.uint16
+    assert raw[0, 0] == 8
+    assert raw[0, 1] == 1604
+    assert raw[1, 0] == 0
+    assert raw[1, 1] == 0
+
+    restored = dequantize_disparity(raw)
+    assert restored.dtype == np.float32
+    assert restored[0, 1] == 100.25
+    assert np.isnan(restored[1, 0])
+    assert dequantize_disparity(disparity) is disparity
+
+
+def test_list_frame_files(tmp_path):
+    for i in (10, 9, 100000):
+        (tmp_path / f"left_{i:05d}.png").touch()
+    (tmp_path / "left_00001.npy").touch()
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "left_00000.png").touch()
+    names = list_frame_files(tmp_path, ".png")
+    assert [name.name for name in names] == ["left_00009.png", "left_00010.png", "left_100000.png"]
+
+
+def test_archive_without_index(tmp_path):
+    writer = DisparityArchiveWriter(tmp_path, max_frames=10)
+    for i in range(1, 4):
+        writer.write(np.full((4, 6), i, dtype=np.uint16))
+    writer.memmap.flush()  # killed before close(), no index is saved.
+    frames = DisparityFrames(tmp_path)
+    assert len(frames) == 3
+    assert frames[2][0, 0] == 3
+
+
+def test_archive_unused_slots(tmp_path):
+    writer = DisparityArchiveWriter(tmp_path, max_frames=10)
+    writer.write(np.ones((4, 6), dtype=np.uint16))
+    writer.close()
+    assert np.load(str(tmp_path / ARCHIVE_NAME)).shape == (10, 4, 6)
+    assert len(DisparityFrames(tmp_path)) == 1
+
+
+def test_recapture_after_kill(tmp_path):
+    writer = DisparityArchiveWriter(tmp_path, max_frames=50)
+    for _ in range(40):
+        writer.write(np.ones((4, 6), dtype=np.uint16))
+    writer.close()
+    assert len(DisparityFrames(tmp_path)) == 40
+
+    writer = DisparityArchiveWriter(tmp_path, max_frames=50, index_interval=2)
+    for _ in range(5):
+        writer.write(np.ones((4, 6), dtype=np.uint16))
+    writer.memmap.flush()  # killed before close()
+    index = ArchiveIndex.load_json(tmp_path / INDEX_NAME)
+    assert index.num_frames == 4
+    assert not index.closed
+    frames = DisparityFrames(tmp_path)
+    assert len(frames) == 5
+    assert all(frame.all() for frame in frames)
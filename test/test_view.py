@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+
+from disparity_view.view import (
+    LEFT_VIDEO_NAME,
+    _video_frames,
+    as_colorimage,
+    as_gray,
+    concat_images,
+    finitemax,
+    finitemin,
+    finite_minmax,
+    left_image_frames,
+    normalize_image,
+    prefetch,
+)
+
+
+def test_finite_minmax():
+    disparity = np.array([[np.nan, 1.0, 2.0], [np.inf, -np.inf, 5.0]], dtype=np.float32)
+    assert finite_minmax(disparity) == (1.0, 5.0)
+    assert finitemin(disparity) == 1.0
+    assert finitemax(disparity) == 5.0
+
+
+def test_normalize_image():
+    disparity = np.array([[0.0, 50.0], [100.0, 100.0]], dtype=np.float32)
+    normalized = normalize_image(disparity, vmax=100.0, vmin=0.0)
+    assert normalized.dtype == np.uint8
+    assert normalized.shape == disparity.shape
+    assert normalized[0, 0] == 0
+    assert normalized[1, 0] == 255
+
+
+def test_normalize_image_clip():
+    disparity = np.array([[-10.0, 200.0]], dtype=np.float32)
+    normalized = normalize_image(disparity, vmax=100.0, vmin=0.0)
+    assert normalized[0, 0] == 0
+    assert normalized[0, 1] == 255
+
+
+def test_as_gray():
+    disparity = np.array([[0.0, 50.0], [100.0, 100.0]], dtype=np.float32)
+    gray = as_gray(disparity, vmin=0.0, vmax=100.0)
+    assert gray.shape == (2, 2, 3)
+    assert gray.dtype == np.uint8
+    assert gray.flags["C_CONTIGUOUS"]
+    assert np.all(gray[:, :, 0] == gray[:, :, 2])
+
+
+def test_prefetch():
+    items = list(range(10))
+    assert list(prefetch(lambda x: x * 2, items, depth=3)) == [x * 2 for x in items]
+    assert list(prefetch(lambda x: x, [])) == []
+
+
+def test_normalize_image_invalid():
+    disparity = np.array([[np.nan, 50.0]], dtype=np.float32)
+    normalized = normalize_image(disparity, vmax=100.0, vmin=0.0)
+    assert normalized[0, 0] == 0
+    assert 127 <= normalized[0, 1] <= 128
+
+
+def test_as_colorimage_dst():
+    disparity = np.array([[0.0, 50.0], [100.0, 100.0]], dtype=np.float32)
+    colored = as_colorimage(disparity, vmin=0.0, vmax=100.0)
+    assert colored.shape == (2, 2, 3)
+    dst = np.zeros_like(colored)
+    reused = as_colorimage(disparity, vmin=0.0, vmax=100.0, dst=dst)
+    assert reused is dst
+    assert np.array_equal(reused, colored)
+
+
+def test_concat_images():
+    left = np.zeros((2, 3, 3), dtype=np.uint8)
+    right = np.full((2, 3, 3), 255, dtype=np.uint8)
+    results = concat_images(left, right)
+    assert np.array_equal(results, np.concatenate((left, right), axis=1))
+    assert concat_images(left, right, dst=results) is results
+
+
+def test_left_image_frames_png(tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f"left_{i:05d}.png"), np.full((8, 16, 3), i, dtype=np.uint8))
+    names, images = left_image_frames(tmp_path)
+    assert [name.name for name in names] == [f"left_{i:05d}.png" for i in range(3)]
+    assert [image[0, 0, 0] for image in images] == [0, 1, 2]
+
+
+def test_left_image_frames_video(tmp_path):
+    writer = cv2.VideoWriter(str(tmp_path / LEFT_VIDEO_NAME), cv2.VideoWriter_fourcc(*"mp4v"), 10, (16, 8))
+    for _ in range(3):
+        writer.write(np.zeros((8, 16, 3), dtype=np.uint8))
+    writer.release()
+    names, images = left_image_frames(tmp_path)
+    assert len(names) == 3
+    assert all(image.shape == (8, 16, 3) for image in images)
+
+
+def test_normalize_image_uint16():
+    raw = np.array([[0, 400, 800, 1600, 3000]], dtype=np.uint16)
+    expected = normalize_image(raw.astype(np.float32), vmax=1600.0, vmin=0.0)
+    normalized = normalize_image(raw, vmax=1600.0, vmin=0.0)
+    assert normalized.dtype == np.uint8
+    assert np.array_equal(normalized, expected)
+    dst = np.zeros_like(normalized)
+    assert normalize_image(raw, vmax=1600.0, vmin=0.0, dst=dst) is dst
+
+
+def test_as_colorimage_uint16():
+    raw = np.array([[0, 400, 800], [1600, 3000, 100]], dtype=np.uint16)
+    for colormap in (cv2.COLORMAP_JET, cv2.COLORMAP_INFERNO):
+        expected = cv2.applyColorMap(normalize_image(raw, vmax=1600.0, vmin=0.0), colormap)
+        colored = as_colorimage(raw, vmin=0.0, vmax=1600.0, colormap=colormap)
+        assert colored.shape == (2, 3, 3)
+        assert np.array_equal(colored, expected)
+        dst = np.zeros_like(colored)
+        assert as_colorimage(raw, vmin=0.0, vmax=1600.0, colormap=colormap, dst=dst) is dst
+        assert np.array_equal(dst, expected)
+
+        uniform = np.zeros((4, 6), dtype=np.uint16)
+        colored = as_colorimage(uniform, colormap=colormap)
+        expected = cv2.applyColorMap(np.zeros((4, 6), dtype=np.uint8), colormap)
+        assert np.array_equal(colored, expected)
+
+
+def test_normalize_image_uint16_uniform():
+    raw = np.zeros((4, 6), dtype=np.uint16)
+    assert np.all(normalize_image(raw) == 0)
+    gray = as_gray(raw)
+    assert gray.shape == (4, 6, 3)
+    assert np.all(gray == 0)
+    assert np.all(normalize_image(raw, vmax=0.0, vmin=0.0) == 0)
+
+
+def test_normalize_image_float_uniform():
+    disparity = np.ones((2, 2), dtype=np.float32)
+    assert np.all(normalize_image(disparity, vmax=5.0, vmin=5.0) == 0)
+    assert np.all(normalize_image(disparity) == 0)
+    dst = np.full((2, 2), 255, dtype=np.uint8)
+    assert normalize_image(disparity, vmax=5.0, vmin=5.0, dst=dst) is dst
+    assert np.all(dst == 0)
+
+
+def test_video_frames_failed_read():
+    class BrokenCapture:
+        def __init__(self):
+            self.count = 0
+            self.released = False
+
+        def read(self):
+            self.count += 1
+            if self.count > 2:
+                return False, None
+            return True, np.zeros((8, 16, 3), dtype=np.uint8)
+
+        def release(self):
+            self.released = True
+
+    cap = BrokenCapture()
+    images = list(_video_frames(cap, num_frames=5))
+    assert len(images) == 2
+    assert cap.released
+
+
+def test_as_colorimage_uint16_dst_row_blocks():
+    raw = np.arange(150 * 7, dtype=np.uint16).reshape(150, 7)
+    expected = as_colorimage(raw, vmin=0.0, vmax=1000.0)
+    dst = np.zeros_like(expected)
+    assert as_colorimage(raw, vmin=0.0, vmax=1000.0, dst=dst) is dst
+    assert np.array_equal(dst, expected)
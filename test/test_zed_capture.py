@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+from disparity_view.zed_capture import StereoImageWriter, _is_ip_address, _is_numerical_ip_address
+
+
+def test_is_numerical_ip_address():
+    assert _is_numerical_ip_address("192.168.0.1")
+    assert not _is_numerical_ip_address("192.168.0.1:30000")
+    assert not _is_numerical_ip_address("192.168.0.1.")
+    assert not _is_numerical_ip_address("192.168.0")
+
+
+def test_is_ip_address():
+    assert _is_ip_address("192.168.0.1:30000")
+    assert not _is_ip_address("192.168.0.1")
+    assert not _is_ip_address("192.168.0.1:")
+    assert not _is_ip_address("192.168.0.1.:30000")
+
+
+def test_stereo_image_writer(tmp_path):
+    leftdir = tmp_path / "left"
+    rightdir = tmp_path / "right"
+    leftdir.mkdir()
+    rightdir.mkdir()
+    writer = StereoImageWriter(leftdir, rightdir, video=False, fps=30, size=(16, 8), max_pending=2)
+    for counter in range(3):
+        image = np.full((8, 16, 3), counter, dtype=np.uint8)
+        writer.write(counter, image, image)
+    writer.close()
+    for counter in range(3):
+        left = cv2.imread(str(leftdir / f"left_{counter:05d}.png"))
+        assert left[0, 0, 0] == counter
+        assert (rightdir / f"right_{counter:05d}.png").is_file()